@@ -0,0 +1,31 @@
+"""
+Gunicorn configuration for the scheduling API
+
+Run with:
+    gunicorn -c gunicorn_conf.py schedule_api:app
+
+By default gevent workers are used, so cheap endpoints (/api/health,
+/api/validate-input) keep answering while other requests are solving.
+OR-Tools solves are CPU-bound C++, so for pure CPU parallelism use sync
+workers instead:
+    GUNICORN_WORKER_CLASS=sync gunicorn -c gunicorn_conf.py schedule_api:app
+"""
+
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+
+# One worker process per CPU core
+workers = int(os.environ.get('GUNICORN_WORKERS', os.cpu_count() or 1))
+
+# Let each worker size its solver process pool and CPU share accordingly
+# (see schedule_api.py)
+os.environ['SCHEDULE_API_WORKERS'] = str(workers)
+
+# 'gevent' for concurrent I/O, 'sync' for one request per worker at a time
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gevent')
+worker_connections = 1000
+
+# Solves can take up to the requested time limit (30s by default, at most
+# MAX_TIME_LIMIT_SECONDS in schedule_api.py, which must stay below this)
+timeout = 120
@@ -3,20 +3,242 @@ RESTful API for university course scheduling using OR-Tools
 This Flask application exposes the scheduling functionality as a web service
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request
 from flask_cors import CORS
-import json
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from typing import Annotated, List, Literal, Optional
+import hashlib
+import msgspec
+import orjson
+import os
+import threading
 import traceback
 import time
-from schedule_solver_backend import ScheduleSolver
+from schedule_solver_backend import DEFAULT_NUM_WORKERS, ScheduleSolver
 
 app = Flask(__name__)
 CORS(app)  # Enable Cross-Origin Resource Sharing
 
+def ojsonify(obj):
+    """Serialize obj to a JSON response using orjson (drop-in for jsonify)"""
+    return app.response_class(orjson.dumps(obj), mimetype='application/json')
+
+# Schedules with at least this many courses are streamed rather than encoded
+# into a single buffer; STREAM_CHUNK_COURSES courses are sent per chunk
+STREAM_MIN_COURSES = 100
+STREAM_CHUNK_COURSES = 64
+
+def _stream_schedule(result):
+    """Yield a solver result as JSON, encoding the schedule a few courses at a time"""
+    yield b'{"schedule":{'
+    parts = []
+    for i, (course_code, assignments) in enumerate(result['schedule'].items()):
+        if i:
+            parts.append(b',')
+        parts.append(orjson.dumps(course_code))
+        parts.append(b':')
+        parts.append(orjson.dumps(assignments))
+        if (i + 1) % STREAM_CHUNK_COURSES == 0:
+            yield b''.join(parts)
+            parts = []
+    parts.append(b'}')
+    
+    # The remaining keys (stats and metadata) close the object
+    rest = orjson.dumps({k: v for k, v in result.items() if k != 'schedule'})
+    parts.append(b',' + rest[1:] if len(rest) > 2 else b'}')
+    yield b''.join(parts)
+
+def _schedule_response(result):
+    """Return a solver result as a JSON response, streaming large schedules"""
+    if len(result['schedule']) < STREAM_MIN_COURSES:
+        return ojsonify(result)
+    return Response(_stream_schedule(result), mimetype='application/json')
+
+class Course(msgspec.Struct):
+    """A course in a scheduling request"""
+    code: str
+    name: str
+    teacher: str
+    hours: Annotated[int, msgspec.Meta(ge=1, le=10)]
+    preferred_days: Optional[Literal['MWF', 'TTh', 'any']] = 'any'
+    priority: int = 3
+    min_room_capacity: int = 30
+
+class Room(msgspec.Struct):
+    """A room available to a scheduling request"""
+    id: str
+    capacity: Annotated[int, msgspec.Meta(ge=1)]
+
+# Most CP-SAT search workers a request may ask for
+MAX_REQUEST_WORKERS = 64
+
+# Longest solve a request may ask for. With SOLVE_TIMEOUT_GRACE_SECONDS on
+# top, a request still finishes within the Gunicorn worker timeout (120s in
+# gunicorn_conf.py); raise both together.
+MAX_TIME_LIMIT_SECONDS = 110
+
+class ScheduleRequest(msgspec.Struct):
+    """Body of /api/generate-schedule and /api/validate-input"""
+    courses: List[Course] = []
+    rooms: List[Room] = []
+    time_limit_seconds: Annotated[float, msgspec.Meta(gt=0, le=MAX_TIME_LIMIT_SECONDS)] = 30
+    workers: Optional[Annotated[int, msgspec.Meta(ge=1, le=MAX_REQUEST_WORKERS)]] = None
+
+def _decode_request():
+    """
+    Decode and validate the request body as a ScheduleRequest
+    
+    Returns None for an empty body; raises msgspec.ValidationError or
+    msgspec.DecodeError for malformed input
+    """
+    body = request.get_data()
+    if not body.strip():
+        return None
+    return msgspec.json.decode(body, type=ScheduleRequest)
+
+# Solved schedules, keyed by a digest of the normalized request (LRU order)
+SCHEDULE_CACHE_SIZE = 128
+_schedule_cache = OrderedDict()
+_schedule_cache_lock = threading.Lock()
+
+def _request_digest(req):
+    """Return a digest identifying the courses, rooms and time limit of a request"""
+    courses = sorted((msgspec.structs.astuple(course) for course in req.courses), key=repr)
+    rooms = sorted((msgspec.structs.astuple(room) for room in req.rooms), key=repr)
+    canonical = msgspec.json.encode([courses, rooms, req.time_limit_seconds])
+    return hashlib.blake2b(canonical, digest_size=16).hexdigest()
+
+def _get_cached_schedule(key):
+    """Return the cached solver result for a request digest, or None"""
+    with _schedule_cache_lock:
+        result = _schedule_cache.get(key)
+        if result is not None:
+            _schedule_cache.move_to_end(key)
+        return result
+
+def _cache_schedule(key, result):
+    """Store a solver result, evicting the least recently used entries"""
+    with _schedule_cache_lock:
+        _schedule_cache[key] = result
+        _schedule_cache.move_to_end(key)
+        while len(_schedule_cache) > SCHEDULE_CACHE_SIZE:
+            _schedule_cache.popitem(last=False)
+
+def _solve_request(req, default_workers=None, deadline=None):
+    """
+    Build a ScheduleSolver from a ScheduleRequest and solve it
+    
+    When a deadline (a time.time() value) is given, the solve stops by then
+    even if the request's time limit would allow more, so time spent waiting
+    for a free pool process counts against the limit.
+    """
+    # Initialize solver
+    solver = ScheduleSolver()
+    
+    # Add rooms (if provided)
+    for room in req.rooms:
+        solver.add_room(room.id, room.capacity)
+    
+    # Add courses
+    for course in req.courses:
+        solver.add_course(
+            code=course.code,
+            name=course.name,
+            teacher=course.teacher,
+            hours=course.hours,
+            # The solver takes None (not 'any') for courses free to use any day
+            preferred_days=None if course.preferred_days == 'any' else course.preferred_days,
+            priority=course.priority,
+            min_room_capacity=course.min_room_capacity
+        )
+    
+    # Number of parallel search workers (None lets the solver pick)
+    workers = req.workers or default_workers
+    
+    time_limit = req.time_limit_seconds
+    if deadline is not None:
+        time_limit = max(0, min(time_limit, deadline - time.time()))
+    
+    return solver.solve(time_limit_seconds=time_limit, num_workers=workers)
+
+# Solves run in a process pool. Model building is pure Python, so separate
+# processes keep solves from holding the GIL of the process serving requests.
+#
+# Every Gunicorn worker has its own pool, so the pool size and the cores its
+# solves use come out of that worker's share of the machine (gunicorn_conf.py
+# sets SCHEDULE_API_WORKERS to its worker count). SCHEDULE_SOLVE_PROCESSES
+# overrides the pool size.
+#
+# The solver's component cache and recent-solution hints live in the pool
+# process that ran a solve. A later request may land on any process of any
+# Gunicorn worker, so behind the API those two mostly miss; the request
+# cache below (in the Gunicorn worker itself) still answers exact repeats.
+SOLVE_TIMEOUT_GRACE_SECONDS = 5
+API_WORKERS = max(1, int(os.environ.get('SCHEDULE_API_WORKERS', 1)))
+SOLVE_PROCESSES = max(1, int(os.environ.get('SCHEDULE_SOLVE_PROCESSES', 2)))
+SOLVE_CORES = max(1, (os.cpu_count() or 1) // API_WORKERS)
+_solve_executor = ProcessPoolExecutor(max_workers=SOLVE_PROCESSES)
+_solve_executor_lock = threading.Lock()
+
+# Solves submitted and not yet finished, so that concurrent solves split the
+# cores between them instead of each asking CP-SAT for all of them
+_in_flight = 0
+_in_flight_lock = threading.Lock()
+
+def _replace_executor(broken):
+    """Swap a broken process pool (e.g. a child was OOM-killed) for a new one"""
+    global _solve_executor
+    with _solve_executor_lock:
+        if _solve_executor is broken:
+            _solve_executor = ProcessPoolExecutor(max_workers=SOLVE_PROCESSES)
+    broken.shutdown(wait=False)
+
+def _solve_finished(_):
+    """Done callback of a pool solve: release its share of the cores"""
+    global _in_flight
+    with _in_flight_lock:
+        _in_flight -= 1
+
+def _submit_solve(req, deadline):
+    """
+    Start a request on the process pool
+    
+    The solve gets an even share of SOLVE_CORES among the solves in flight
+    (at most DEFAULT_NUM_WORKERS) and stops by the given deadline. A broken
+    pool is replaced, so one crashed solve doesn't fail every later request.
+    Returns a Future for the solver result.
+    """
+    global _in_flight
+    with _in_flight_lock:
+        _in_flight += 1
+        workers = min(DEFAULT_NUM_WORKERS, max(1, SOLVE_CORES // _in_flight))
+    executor = _solve_executor
+    try:
+        try:
+            future = executor.submit(_solve_request, req, workers, deadline)
+        except BrokenProcessPool:
+            _replace_executor(executor)
+            executor = _solve_executor
+            future = executor.submit(_solve_request, req, workers, deadline)
+    except Exception:
+        _solve_finished(None)
+        raise
+    
+    def finished(done):
+        _solve_finished(done)
+        if not done.cancelled() and isinstance(done.exception(), BrokenProcessPool):
+            _replace_executor(executor)
+    
+    future.add_done_callback(finished)
+    return future
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """Basic health check endpoint"""
-    return jsonify({
+    return ojsonify({
         'status': 'healthy',
         'timestamp': time.time(),
         'message': 'Schedule API is running'
@@ -46,64 +268,84 @@ def generate_schedule():
             {"id": "B205", "capacity": 50},
             ...
         ],
-        "time_limit_seconds": 30
+        "time_limit_seconds": 30,
+        "workers": 8
     }
     """
     try:
-        # Parse request data
-        data = request.json
-        if not data:
-            return jsonify({
+        # Parse and validate request data
+        try:
+            req = _decode_request()
+        except (msgspec.ValidationError, msgspec.DecodeError) as e:
+            return ojsonify({
                 'success': False,
-                'message': 'No data provided'
+                'message': f'Invalid request: {str(e)}'
             }), 400
         
-        # Initialize solver
-        solver = ScheduleSolver()
-        
-        # Add rooms (if provided)
-        if 'rooms' in data and data['rooms']:
-            for room in data['rooms']:
-                solver.add_room(room['id'], room['capacity'])
+        if req is None:
+            return ojsonify({
+                'success': False,
+                'message': 'No data provided'
+            }), 400
         
-        # Add courses
-        if 'courses' not in data or not data['courses']:
-            return jsonify({
+        if not req.courses:
+            return ojsonify({
                 'success': False,
                 'message': 'No courses provided'
             }), 400
         
-        for course in data['courses']:
-            solver.add_course(
-                code=course['code'],
-                name=course['name'],
-                teacher=course['teacher'],
-                hours=course['hours'],
-                preferred_days=course.get('preferred_days', 'any'),
-                priority=course.get('priority', 3),
-                min_room_capacity=course.get('min_room_capacity', 30)
-            )
-        
-        # Set time limit (with reasonable default)
-        time_limit = data.get('time_limit_seconds', 30)
-        
-        # Generate schedule
+        # Identical requests are answered from the cache without re-solving
         start_time = time.time()
-        result = solver.solve(time_limit_seconds=time_limit)
+        cache_key = _request_digest(req)
+        cached = _get_cached_schedule(cache_key)
+        if cached is not None:
+            result = dict(cached)
+            result['processing_time'] = time.time() - start_time
+            result['api_version'] = '1.0'
+            result['cached'] = True
+            return _schedule_response(result), 200
+        
+        # Hand the solve to the process pool and wait for it to finish. The
+        # solve itself stops at the deadline, so an abandoned one frees its
+        # process soon after; one still waiting for a process is dropped.
+        deadline = start_time + req.time_limit_seconds
+        give_up = deadline + SOLVE_TIMEOUT_GRACE_SECONDS
+        future = _submit_solve(req, deadline)
+        try:
+            try:
+                result = future.result(timeout=give_up - time.time())
+            except BrokenProcessPool:
+                # The pool broke (e.g. a process was killed) while this solve
+                # was queued or running; retry once on the replacement pool
+                future = _submit_solve(req, deadline)
+                result = future.result(timeout=max(give_up - time.time(), 0))
+        except FutureTimeoutError:
+            future.cancel()
+            return ojsonify({
+                'success': False,
+                'message': 'Timed out waiting for the scheduler'
+            }), 504
         end_time = time.time()
         
+        # Timed-out solves may do better on a retry, and other statuses
+        # (e.g. MODEL_INVALID) depend on parameters left out of the digest,
+        # so only cache definite answers
+        if result['stats']['status'] in ('OPTIMAL', 'INFEASIBLE'):
+            _cache_schedule(cache_key, dict(result))
+        
         # Add extra metadata
         result['processing_time'] = end_time - start_time
         result['api_version'] = '1.0'
+        result['cached'] = False
         
-        return jsonify(result), 200
+        return _schedule_response(result), 200
     
     except Exception as e:
         # Log the error (would go to application logs)
         print(f"Error generating schedule: {str(e)}")
         print(traceback.format_exc())
         
-        return jsonify({
+        return ojsonify({
             'success': False,
             'message': f'Error generating schedule: {str(e)}',
             'error_type': type(e).__name__
@@ -116,121 +358,105 @@ def validate_input():
     Useful for checking if the courses and constraints are properly formatted
     """
     try:
-        data = request.json
-        if not data:
-            return jsonify({
+        try:
+            req = _decode_request()
+        except (msgspec.ValidationError, msgspec.DecodeError) as e:
+            return ojsonify({
                 'valid': False,
-                'message': 'No data provided'
+                'issues': [str(e)]
             }), 400
         
-        # Validate courses
-        if 'courses' not in data or not data['courses']:
-            return jsonify({
+        if req is None:
+            return ojsonify({
                 'valid': False,
-                'message': 'No courses provided'
+                'message': 'No data provided'
             }), 400
         
-        issues = []
-        for i, course in enumerate(data['courses']):
-            required_fields = ['code', 'name', 'teacher', 'hours']
-            for field in required_fields:
-                if field not in course:
-                    issues.append(f"Course {i+1} is missing required field: {field}")
-            
-            if 'hours' in course and (not isinstance(course['hours'], int) or course['hours'] < 1 or course['hours'] > 10):
-                issues.append(f"Course {i+1} ({course.get('code', 'unknown')}): Hours must be an integer between 1 and 10")
-            
-            if 'preferred_days' in course and course['preferred_days'] not in ['MWF', 'TTh', 'any']:
-                issues.append(f"Course {i+1} ({course.get('code', 'unknown')}): Preferred days must be 'MWF', 'TTh', or 'any'")
-        
-        # Validate rooms (if provided)
-        if 'rooms' in data and data['rooms']:
-            for i, room in enumerate(data['rooms']):
-                if 'id' not in room:
-                    issues.append(f"Room {i+1} is missing required field: id")
-                if 'capacity' not in room:
-                    issues.append(f"Room {i+1} is missing required field: capacity")
-                elif not isinstance(room['capacity'], int) or room['capacity'] < 1:
-                    issues.append(f"Room {i+1} ({room.get('id', 'unknown')}): Capacity must be a positive integer")
-        
-        if issues:
-            return jsonify({
+        # Validate courses
+        if not req.courses:
+            return ojsonify({
                 'valid': False,
-                'issues': issues
+                'message': 'No courses provided'
             }), 400
         
-        return jsonify({
+        return ojsonify({
             'valid': True,
             'message': 'Input data is valid'
         }), 200
     
     except Exception as e:
-        return jsonify({
+        return ojsonify({
             'valid': False,
             'message': f'Error validating input: {str(e)}'
         }), 500
 
+# The demo configuration never changes, so it is encoded once at import
+DEMO_DATA = {
+    "courses": [
+        {
+            "code": "CS101",
+            "name": "Introduction to Computer Science",
+            "teacher": "Prof. Smith",
+            "hours": 3,
+            "preferred_days": "MWF",
+            "priority": 5,
+            "min_room_capacity": 100
+        },
+        {
+            "code": "CS201",
+            "name": "Data Structures",
+            "teacher": "Prof. Johnson",
+            "hours": 3,
+            "preferred_days": "TTh",
+            "priority": 4,
+            "min_room_capacity": 50
+        },
+        {
+            "code": "MATH101",
+            "name": "Calculus I",
+            "teacher": "Prof. Williams",
+            "hours": 4,
+            "preferred_days": "MWF",
+            "priority": 5,
+            "min_room_capacity": 150
+        },
+        {
+            "code": "ENG210",
+            "name": "Creative Writing",
+            "teacher": "Prof. Davis",
+            "hours": 3,
+            "preferred_days": "TTh",
+            "priority": 3,
+            "min_room_capacity": 30
+        },
+        {
+            "code": "PHYS101",
+            "name": "Physics I",
+            "teacher": "Prof. Garcia",
+            "hours": 4,
+            "preferred_days": "MWF",
+            "priority": 4,
+            "min_room_capacity": 100
+        }
+    ],
+    "rooms": [
+        {"id": "A101", "capacity": 30},
+        {"id": "B205", "capacity": 50},
+        {"id": "C301", "capacity": 100},
+        {"id": "D102", "capacity": 150}
+    ],
+    "time_limit_seconds": 10
+}
+
+_DEMO_BYTES = orjson.dumps(DEMO_DATA)
+_DEMO_ETAG = hashlib.blake2b(_DEMO_BYTES, digest_size=16).hexdigest()
+
 @app.route('/api/examples/demo-schedule', methods=['GET'])
 def demo_schedule():
     """Return a demo schedule configuration that can be used for testing"""
-    demo_data = {
-        "courses": [
-            {
-                "code": "CS101",
-                "name": "Introduction to Computer Science",
-                "teacher": "Prof. Smith",
-                "hours": 3,
-                "preferred_days": "MWF",
-                "priority": 5,
-                "min_room_capacity": 100
-            },
-            {
-                "code": "CS201",
-                "name": "Data Structures",
-                "teacher": "Prof. Johnson",
-                "hours": 3,
-                "preferred_days": "TTh",
-                "priority": 4,
-                "min_room_capacity": 50
-            },
-            {
-                "code": "MATH101",
-                "name": "Calculus I",
-                "teacher": "Prof. Williams",
-                "hours": 4,
-                "preferred_days": "MWF",
-                "priority": 5,
-                "min_room_capacity": 150
-            },
-            {
-                "code": "ENG210",
-                "name": "Creative Writing",
-                "teacher": "Prof. Davis",
-                "hours": 3,
-                "preferred_days": "TTh",
-                "priority": 3,
-                "min_room_capacity": 30
-            },
-            {
-                "code": "PHYS101",
-                "name": "Physics I",
-                "teacher": "Prof. Garcia",
-                "hours": 4,
-                "preferred_days": "MWF",
-                "priority": 4,
-                "min_room_capacity": 100
-            }
-        ],
-        "rooms": [
-            {"id": "A101", "capacity": 30},
-            {"id": "B205", "capacity": 50},
-            {"id": "C301", "capacity": 100},
-            {"id": "D102", "capacity": 150}
-        ],
-        "time_limit_seconds": 10
-    }
-    
-    return jsonify(demo_data), 200
+    response = app.response_class(_DEMO_BYTES, mimetype='application/json')
+    response.set_etag(_DEMO_ETAG)
+    return response.make_conditional(request)
 
 if __name__ == '__main__':
     # Run the Flask app (for development only)
@@ -13,40 +13,162 @@ Author: Mark
 """
 
 from ortools.sat.python import cp_model
+import numpy as np
+from array import array
+from collections import OrderedDict, defaultdict
 import logging
+import os
+import threading
 import time
+from types import MappingProxyType
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, 
                     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Solved components, keyed by ScheduleSolver._component_key (LRU order)
+COMPONENT_CACHE_SIZE = 256
+_component_cache = OrderedDict()
+_component_cache_lock = threading.Lock()
+
+def _get_cached_component(key):
+    """Return the cached result for a component signature, or None."""
+    with _component_cache_lock:
+        result = _component_cache.get(key)
+        if result is not None:
+            _component_cache.move_to_end(key)
+        return result
+
+def _cache_component(key, result):
+    """Store a component result, evicting the least recently used entries."""
+    with _component_cache_lock:
+        _component_cache[key] = result
+        _component_cache.move_to_end(key)
+        while len(_component_cache) > COMPONENT_CACHE_SIZE:
+            _component_cache.popitem(last=False)
+
+# Recently found assignments, keyed by the frozenset of course codes they
+# cover (LRU order). Used to warm-start solves of similar course sets.
+RECENT_SOLUTIONS_SIZE = 32
+HINT_MIN_SIMILARITY = 0.8
+_recent_solutions = OrderedDict()
+_recent_solutions_lock = threading.Lock()
+
+def _find_similar_solution(course_codes):
+    """
+    Return the assignments of the most similar recent solution, or None.
+    
+    Similarity is the Jaccard index between course code sets; only solutions
+    above HINT_MIN_SIMILARITY are considered.
+    """
+    codes = frozenset(course_codes)
+    best, best_similarity = None, HINT_MIN_SIMILARITY
+    with _recent_solutions_lock:
+        for other, assignments in _recent_solutions.items():
+            similarity = len(codes & other) / len(codes | other)
+            if similarity > best_similarity:
+                best, best_similarity = assignments, similarity
+    return best
+
+def _remember_solution(course_codes, assignments):
+    """Record a solution for warm-starting later solves."""
+    with _recent_solutions_lock:
+        key = frozenset(course_codes)
+        _recent_solutions[key] = assignments
+        _recent_solutions.move_to_end(key)
+        while len(_recent_solutions) > RECENT_SOLUTIONS_SIZE:
+            _recent_solutions.popitem(last=False)
+
+# Instances with courses * rooms * 50 below this are solved by a plain
+# depth-first search, which hands over to CP-SAT after checking
+# SMALL_SEARCH_CHECK_LIMIT candidate assignments
+SMALL_INSTANCE_LIMIT = 2000
+SMALL_SEARCH_CHECK_LIMIT = 200000
+
+# Domain of a Boolean variable in the model proto
+BOOL_DOMAIN = (0, 1)
+
+# CP-SAT parameters shared by every solve. symmetry_level=2 lets presolve
+# detect the room/slot symmetries that are common in course scheduling. The
+# model is almost pure feasibility over Booleans, so the LP relaxation and
+# extra Boolean encodings only slow the search down (about 30% faster without
+# them on 80-160 course instances), as does full probing. Search branching
+# stays automatic: forcing FIXED_SEARCH onto the model's decision strategy
+# left some models that the greedy seed can't place unsolved for the whole
+# time limit on a single worker.
+DEFAULT_SOLVER_PARAMETERS = MappingProxyType({
+    'linearization_level': 0,
+    'boolean_encoding_level': 0,
+    'cp_model_probing_level': 1,
+    'cp_model_presolve': True,
+    'symmetry_level': 2,
+    'log_search_progress': False
+})
+# Parameters for the safety-net re-solve (CP-SAT's own defaults) when the
+# tuned parameters report infeasibility almost immediately
+FALLBACK_SOLVER_PARAMETERS = MappingProxyType({'log_search_progress': False})
+FAST_INFEASIBLE_SECONDS = 0.1
+DEFAULT_NUM_WORKERS = min(8, os.cpu_count() or 1)
+
+def _create_solver(time_limit_seconds, num_workers=None, parameters=DEFAULT_SOLVER_PARAMETERS):
+    """Return a CpSolver configured with the given parameters."""
+    solver = cp_model.CpSolver()
+    params = solver.parameters
+    for name, value in parameters.items():
+        setattr(params, name, value)
+    params.max_time_in_seconds = time_limit_seconds
+    params.num_search_workers = num_workers or DEFAULT_NUM_WORKERS
+    return solver
+
 class ScheduleSolver:
     """Handles university course scheduling using constraint programming."""
     
-    def __init__(self):
-        """Initialize the scheduler with empty containers for courses, rooms, and constraints."""
+    # Define standard time slots (shared, immutable)
+    mwf_slots = (
+        "08:00-08:50", "09:00-09:50", "10:00-10:50", "11:00-11:50",
+        "12:00-12:50", "13:00-13:50", "14:00-14:50", "15:00-15:50",
+        "16:00-16:50", "17:00-17:50"
+    )
+    
+    tth_slots = (
+        "08:00-09:15", "09:30-10:45", "11:00-12:15", "12:30-13:45",
+        "14:00-15:15", "15:30-16:45", "17:00-18:15"
+    )
+    
+    days = MappingProxyType({
+        "MWF": ("Monday", "Wednesday", "Friday"),
+        "TTh": ("Tuesday", "Thursday")
+    })
+    
+    # Integer index tables for days and time slots. Model variables and their
+    # bucket keys refer to these instead of the display strings.
+    _day_names = days["MWF"] + days["TTh"]
+    _slot_names = mwf_slots + tth_slots
+    _block_indices = MappingProxyType({
+        "MWF": (range(len(days["MWF"])), range(len(mwf_slots))),
+        "TTh": (range(len(days["MWF"]), len(_day_names)),
+                range(len(mwf_slots), len(_slot_names)))
+    })
+    
+    def __init__(self, debug=False):
+        """
+        Initialize the scheduler with empty containers for courses, rooms, and constraints.
+        
+        Args:
+            debug: Give CP-SAT variables descriptive names (slower model building)
+        """
+        self.debug = debug
+        self.reset()
+    
+    def reset(self):
+        """Clear all courses, rooms, teachers and departments so the instance can be reused."""
         self.courses = {}
         self.rooms = {}
-        self.teachers = set()
+        # Teachers in first-seen order, and each teacher's position in it
+        self.teachers = []
+        self.teacher_index = {}
         self.departments = {}
-        
-        # Define standard time slots
-        self.mwf_slots = [
-            "08:00-08:50", "09:00-09:50", "10:00-10:50", "11:00-11:50",
-            "12:00-12:50", "13:00-13:50", "14:00-14:50", "15:00-15:50",
-            "16:00-16:50", "17:00-17:50"
-        ]
-        
-        self.tth_slots = [
-            "08:00-09:15", "09:30-10:45", "11:00-12:15", "12:30-13:45",
-            "14:00-15:15", "15:30-16:45", "17:00-18:15"
-        ]
-        
-        self.days = {
-            "MWF": ["Monday", "Wednesday", "Friday"],
-            "TTh": ["Tuesday", "Thursday"]
-        }
 
     def add_course(self, code, name, teacher, hours, preferred_days=None, 
                   min_room_capacity=0, department=None, priority=1):
@@ -73,14 +195,16 @@ class ScheduleSolver:
             'priority': priority
         }
         
-        self.teachers.add(teacher)
+        if teacher not in self.teacher_index:
+            self.teacher_index[teacher] = len(self.teachers)
+            self.teachers.append(teacher)
         
         if department:
             if department not in self.departments:
                 self.departments[department] = []
             self.departments[department].append(code)
             
-        logger.info(f"Added course: {code} - {name} taught by {teacher}")
+        logger.debug("Added course: %s - %s taught by %s", code, name, teacher)
         
     def add_room(self, room_id, capacity, features=None):
         """
@@ -95,184 +219,598 @@ class ScheduleSolver:
             'capacity': capacity,
             'features': features or []
         }
-        logger.info(f"Added room: {room_id} with capacity {capacity}")
+        logger.debug("Added room: %s with capacity %s", room_id, capacity)
         
-    def solve(self, time_limit_seconds=60):
+    def _course_blocks(self, course):
+        """Return the (pattern, days, slots) blocks a course may be scheduled in."""
+        # Determine which pattern this course follows (MWF or TTh)
+        pattern = course['preferred_days'] if course['preferred_days'] else "ANY"
+        
+        blocks = []
+        if pattern in ["MWF", "ANY"]:
+            blocks.append(("MWF", self.days["MWF"], self.mwf_slots))
+        if pattern in ["TTh", "ANY"]:
+            blocks.append(("TTh", self.days["TTh"], self.tth_slots))
+        return blocks
+    
+    def _room_compatibility(self):
         """
-        Solve the scheduling problem using CP-SAT solver.
+        Return which rooms are large enough for each course.
+        
+        The course x room comparison is done in one vectorized step; solve()
+        computes it once and hands it to every stage that needs it.
+        
+        Returns:
+            Dictionary mapping each course code to a boolean array with one
+            entry per room, in the order of self.rooms
+        """
+        capacities = np.array([room['capacity'] for room in self.rooms.values()])
+        min_capacities = np.array([course['min_room_capacity'] for course in self.courses.values()])
+        compat = capacities[None, :] >= min_capacities[:, None]
+        return dict(zip(self.courses, compat))
+    
+    def _independent_components(self, compat):
+        """
+        Partition the courses into groups that can be scheduled independently.
+        
+        Two courses interact only if they can land in the same block (MWF or
+        TTh) and share a teacher, a department, or a room with enough capacity
+        for both. Courses are joined through those shared resources with a
+        union-find, so no pairwise comparison is needed.
+        
+        Args:
+            compat: Room compatibility of each course (see _room_compatibility)
+        
+        Returns:
+            List of course code lists, one per connected component
+        """
+        parent = {code: code for code in self.courses}
+        
+        def find(code):
+            while parent[code] != code:
+                parent[code] = parent[parent[code]]
+                code = parent[code]
+            return code
+        
+        teacher_index = self.teacher_index
+        owner = {}
+        for course_code, course in self.courses.items():
+            teacher = teacher_index[course['teacher']]
+            dept = course['department']
+            # Rooms are identified by their index in self.rooms
+            rooms = np.flatnonzero(compat[course_code]).tolist()
+            resources = []
+            for pattern, _, _ in self._course_blocks(course):
+                resources.append((pattern, 'teacher', teacher))
+                if dept:
+                    resources.append((pattern, 'dept', dept))
+                for r_idx in rooms:
+                    resources.append((pattern, 'room', r_idx))
+            
+            for resource in resources:
+                other = owner.setdefault(resource, course_code)
+                root_a, root_b = find(course_code), find(other)
+                if root_a != root_b:
+                    parent[root_b] = root_a
+        
+        components = defaultdict(list)
+        for course_code in self.courses:
+            components[find(course_code)].append(course_code)
+        return list(components.values())
+    
+    def _component_key(self, course_codes):
+        """Return a canonical, hashable signature of a component's inputs."""
+        courses = tuple(sorted(
+            (code, repr(tuple(sorted(self.courses[code].items()))))
+            for code in course_codes
+        ))
+        min_capacity = min(self.courses[code]['min_room_capacity'] for code in course_codes)
+        rooms = tuple(sorted(
+            (room_id, room['capacity']) for room_id, room in self.rooms.items()
+            if room['capacity'] >= min_capacity
+        ))
+        return (courses, rooms)
+    
+    def _solve_component(self, course_codes, compat, time_limit_seconds, num_workers,
+                         solver_params=None):
+        """
+        Build and solve the CP-SAT model for one independent group of courses.
         
         Args:
+            course_codes: Codes of the courses in the component
+            compat: Room compatibility of each course (see _room_compatibility)
             time_limit_seconds: Maximum time to spend solving
+            num_workers: Number of parallel CP-SAT search workers
+            solver_params: CP-SAT parameters overriding DEFAULT_SOLVER_PARAMETERS
             
         Returns:
-            Dictionary with schedule and statistics
+            Dictionary with the solver status, statistics and, when a solution
+            was found, the assignments for each course
         """
-        start_time = time.time()
-        
-        # Create the CP-SAT model
+        # Create the CP-SAT model. It is written straight into the model proto:
+        # variables are proto indices, and constraints are appended in bulk
+        # rather than through one wrapper call (and type check) each.
         model = cp_model.CpModel()
+        proto = model.Proto()
+        variables = proto.variables
+        constraints = proto.constraints
+        num_vars = 0
         
-        # If no courses or rooms, return empty schedule
-        if not self.courses or not self.rooms:
-            logger.warning("No courses or rooms defined")
-            return {'schedule': {}, 'stats': {'status': 'No courses or rooms defined'}}
+        day_names = self._day_names
+        slot_names = self._slot_names
+        block_indices = self._block_indices
+        
+        # Rooms with the same capacity and features are interchangeable, so
+        # they are merged into pools: courses pick a pool, and concrete rooms
+        # are handed out once the model is solved. This removes the room
+        # symmetry from the search instead of making CP-SAT enumerate it.
+        pools = defaultdict(list)
+        for r_idx, room in enumerate(self.rooms.values()):
+            pools[(room['capacity'], tuple(room['features']))].append(r_idx)
+        room_ids = list(self.rooms)
+        pool_rooms = [[room_ids[r_idx] for r_idx in rooms] for rooms in pools.values()]
         
-        # Create variables
+        # Create variables: per course, a flat array of BoolVar proto indices
+        # with parallel day/slot/pool index arrays
         course_vars = {}
         
+        # Bucket each variable by the resources it occupies as it is created,
+        # so the no-overlap constraints below don't have to rescan every course
+        by_room = defaultdict(list)
+        by_teacher = defaultdict(list)
+        by_dept = defaultdict(list)
+        
+        debug = self.debug
+        # Teachers are keyed by index, which is cheaper to hash than the name
+        teacher_index = self.teacher_index
+        
+        # Course x pool compatibility: the rooms of a pool share a capacity, so
+        # each pool takes the column of its first room
+        pool_compat = np.array([compat[code] for code in course_codes])[
+            :, [rooms[0] for rooms in pools.values()]]
+        
         # For each course, create decision variables for day, time slot, and room
-        for course_code in self.courses:
+        for c_idx, course_code in enumerate(course_codes):
             course = self.courses[course_code]
-            
-            # Determine which pattern this course follows (MWF or TTh)
-            pattern = course['preferred_days'] if course['preferred_days'] else "ANY"
+            teacher = teacher_index[course['teacher']]
+            dept = course['department']
             
             # Create variables for each possible assignment
-            course_vars[course_code] = {}
+            cv = course_vars[course_code] = {
+                'vars': array('i'), 'day': array('h'), 'slot': array('h'), 'pool': array('h')
+            }
+            
+            # Only consider rooms with sufficient capacity
+            pools_for_course = np.flatnonzero(pool_compat[c_idx]).tolist()
+            if not pools_for_course:
+                continue
+            
+            # Every (day, slot) cell gets one variable per pool, numbered
+            # consecutively, so the per-course arrays and the teacher and
+            # department buckets are extended once per cell
+            num_pools = len(pools_for_course)
+            pool_codes = array('h', pools_for_course)
+            vars_extend = cv['vars'].extend
+            day_extend = cv['day'].extend
+            slot_extend = cv['slot'].extend
+            pool_extend = cv['pool'].extend
+            for pattern, _, _ in self._course_blocks(course):
+                day_range, slot_range = block_indices[pattern]
+                for s_idx in slot_range:
+                    slot_name = slot_names[s_idx]
+                    slot_codes = array('h', [s_idx]) * num_pools
+                    for d_idx in day_range:
+                        cell_vars = range(num_vars, num_vars + num_pools)
+                        num_vars += num_pools
+                        for var, p_idx in zip(cell_vars, pools_for_course):
+                            proto_var = variables.add()
+                            proto_var.domain.extend(BOOL_DOMAIN)
+                            # Names are only useful when inspecting the model
+                            if debug:
+                                rooms = '|'.join(pool_rooms[p_idx])
+                                proto_var.name = f"{course_code}_{day_names[d_idx]}_{slot_name}_{rooms}"
+                            by_room[(d_idx, s_idx, p_idx)].append(var)
+                        vars_extend(cell_vars)
+                        day_extend(array('h', [d_idx]) * num_pools)
+                        slot_extend(slot_codes)
+                        pool_extend(pool_codes)
+                        by_teacher[(d_idx, s_idx, teacher)].extend(cell_vars)
+                        if dept:
+                            by_dept[(d_idx, s_idx, dept)].extend(cell_vars)
+        
+        # Try a greedy first-fit schedule first: when it places every course,
+        # the constraints, objective and search setup below aren't needed
+        seed = self._greedy_seed(course_vars, pool_rooms)
+        
+        if len(seed) == len(course_vars):
+            # The greedy schedule places every course. Every course must be
+            # scheduled, so the objective is the same for all solutions and
+            # this one is already optimal; CP-SAT has nothing left to do.
+            status = cp_model.OPTIMAL
+            result = {
+                'status': 'OPTIMAL',
+                'branches': 0,
+                'conflicts': 0,
+                'objective_value': float(sum(self.courses[code]['priority']
+                                             for code in course_codes)),
+                'assignments': {}
+            }
+            chosen = np.sort(np.array(seed, dtype=np.int64))
+        else:
+            # Each course must be scheduled exactly once
+            for cv in course_vars.values():
+                constraints.add().exactly_one.literals.extend(cv['vars'])
+            
+            # A room cannot be double-booked, so a pool holds at most as many
+            # courses per time slot as it has rooms
+            for (_, _, p_idx), bucket in by_room.items():
+                size = len(pool_rooms[p_idx])
+                if len(bucket) > size:
+                    if size == 1:
+                        constraints.add().at_most_one.literals.extend(bucket)
+                    else:
+                        linear = constraints.add().linear
+                        linear.vars.extend(bucket)
+                        linear.coeffs.extend([1] * len(bucket))
+                        linear.domain.extend((0, size))
+            
+            # A teacher cannot teach two courses at the same time, and a
+            # department has at most one course per time slot (so its courses
+            # are spread throughout the day)
+            for buckets in (by_teacher, by_dept):
+                for bucket in buckets.values():
+                    if len(bucket) > 1:
+                        constraints.add().at_most_one.literals.extend(bucket)
+            
+            # Objective: maximize priority-weighted assignments. The proto only
+            # minimizes, so store the negated objective with a -1 scaling factor.
+            objective = proto.objective
+            for course_code, cv in course_vars.items():
+                priority = self.courses[course_code]['priority']
+                objective.vars.extend(cv['vars'])
+                objective.coeffs.extend([-priority] * len(cv['vars']))
+            objective.scaling_factor = -1
+            
+            # Decision strategy: place high-priority, long courses first, each
+            # at its earliest free slot (variables are created slot by slot).
+            # All variables are Boolean, so CHOOSE_FIRST follows this order.
+            # Under automatic search this guides the search without fixing it.
+            order = sorted(course_vars, key=lambda code: (-self.courses[code]['priority'],
+                                                          -self.courses[code]['hours']))
+            strategy = proto.search_strategy.add()
+            for course_code in order:
+                strategy.variables.extend(course_vars[course_code]['vars'])
+            strategy.variable_selection_strategy = cp_model.CHOOSE_FIRST
+            strategy.domain_reduction_strategy = cp_model.SELECT_MAX_VALUE
+            
+            # Warm-start from a recent solution of a similar course set, hinting
+            # the previous assignment of every course where it is still possible,
+            # or else from the partial greedy schedule
+            previous = _find_similar_solution(course_codes)
+            hint = proto.solution_hint
+            if previous:
+                pool_of_room = {room_id: p_idx for p_idx, rooms in enumerate(pool_rooms)
+                                for room_id in rooms}
+                for course_code, cv in course_vars.items():
+                    for a in previous.get(course_code, ()):
+                        p_idx = pool_of_room.get(a['room'])
+                        for i, var in enumerate(cv['vars']):
+                            if (day_names[cv['day'][i]] == a['day'] and
+                                    slot_names[cv['slot'][i]] == a['time'] and
+                                    cv['pool'][i] == p_idx):
+                                hint.vars.append(var)
+                                hint.values.append(1)
+                                break
+            else:
+                hint.vars.extend(seed)
+                hint.values.extend([1] * len(seed))
             
-            # Handle MWF pattern (or ANY)
-            if pattern in ["MWF", "ANY"]:
-                for time_idx, time_slot in enumerate(self.mwf_slots):
-                    for day in self.days["MWF"]:
-                        for room_id in self.rooms:
-                            # Only consider rooms with sufficient capacity
-                            if self.rooms[room_id]['capacity'] >= course['min_room_capacity']:
-                                var_name = f"{course_code}_{day}_{time_slot}_{room_id}"
-                                course_vars[course_code][(day, time_slot, room_id)] = model.NewBoolVar(var_name)
+            # Create solver and solve
+            parameters = dict(DEFAULT_SOLVER_PARAMETERS)
+            parameters.update(solver_params or {})
+            solver = _create_solver(time_limit_seconds, num_workers, parameters)
+            
+            status = solver.Solve(model)
+            
+            # An instant infeasibility proof comes from presolve; double-check
+            # it with CP-SAT's default parameters in case the tuning is to blame
+            if status == cp_model.INFEASIBLE and solver.WallTime() < FAST_INFEASIBLE_SECONDS:
+                remaining = max(time_limit_seconds - solver.WallTime(), 0)
+                solver = _create_solver(remaining, num_workers, FALLBACK_SOLVER_PARAMETERS)
+                status = solver.Solve(model)
+            
+            result = {
+                'status': solver.StatusName(status),
+                'branches': solver.NumBranches(),
+                'conflicts': solver.NumConflicts(),
+                'objective_value': None,
+                'assignments': {}
+            }
+            if status == cp_model.OPTIMAL or status == cp_model.FEASIBLE:
+                result['objective_value'] = solver.ObjectiveValue()
+                chosen = np.flatnonzero(np.array(solver.ResponseProto().solution, dtype=np.int8))
+        
+        if status == cp_model.OPTIMAL or status == cp_model.FEASIBLE:
+            # Variables are numbered course by course, so each chosen variable
+            # maps back to its course (and its position in the course's
+            # arrays) through the index of the course's first variable
+            assignments = result['assignments']
+            codes = list(course_vars)
+            for course_code in codes:
+                assignments[course_code] = []
+            starts = np.cumsum([0] + [len(course_vars[code]['vars']) for code in codes[:-1]])
+            owners = np.searchsorted(starts, chosen, side='right') - 1
+            # Hand out the rooms of each pool in order within every time slot
+            rooms_taken = defaultdict(int)
+            for var, c_idx in zip(chosen.tolist(), owners.tolist()):
+                course_code = codes[c_idx]
+                cv = course_vars[course_code]
+                i = var - int(starts[c_idx])
+                cell = (cv['day'][i], cv['slot'][i], cv['pool'][i])
+                room_id = pool_rooms[cell[2]][rooms_taken[cell]]
+                rooms_taken[cell] += 1
+                assignments[course_code].append({
+                    'day': day_names[cell[0]],
+                    'time': slot_names[cell[1]],
+                    'room': room_id
+                })
+            _remember_solution(course_codes, result['assignments'])
+        
+        return result
+    
+    def _greedy_seed(self, course_vars, pool_rooms):
+        """
+        Build a first-fit schedule for a component.
+        
+        Courses are placed by descending priority, then hours, each at its
+        first option (in variable creation order) that keeps its room pool,
+        teacher and department free. Courses that don't fit are left out, and
+        the partial schedule only serves as a CP-SAT hint; a complete one is
+        used as the solution.
+        
+        Args:
+            course_vars: Per-course variable arrays built by _solve_component
+            pool_rooms: Room IDs of each room pool
+            
+        Returns:
+            List of the proto indices of the chosen variables
+        """
+        pool_used = defaultdict(int)
+        pool_sizes = [len(rooms) for rooms in pool_rooms]
+        occupied = set()
+        chosen = []
+        courses = self.courses
+        teacher_index = self.teacher_index
+        order = sorted(course_vars, key=lambda code: (-courses[code]['priority'],
+                                                      -courses[code]['hours']))
+        for course_code in order:
+            course = courses[course_code]
+            teacher = teacher_index[course['teacher']]
+            dept = course['department']
+            cv = course_vars[course_code]
+            days, slots, pools = cv['day'], cv['slot'], cv['pool']
+            for i, var in enumerate(cv['vars']):
+                cell = (days[i], slots[i])
+                pool_cell = cell + (pools[i],)
+                if pool_used[pool_cell] >= pool_sizes[pools[i]]:
+                    continue
+                if (cell, 'teacher', teacher) in occupied:
+                    continue
+                if dept and (cell, 'dept', dept) in occupied:
+                    continue
+                pool_used[pool_cell] += 1
+                occupied.add((cell, 'teacher', teacher))
+                if dept:
+                    occupied.add((cell, 'dept', dept))
+                chosen.append(var)
+                break
+        return chosen
+    
+    def _solve_small(self, compat):
+        """
+        Solve a tiny instance with a depth-first search instead of CP-SAT.
+        
+        At each step the remaining course with the fewest free (day, slot,
+        room) options is assigned next (ties go to the higher priority), and
+        the search backtracks as soon as any remaining course has no option
+        left. Every course must be scheduled, so the objective is the same for
+        every complete assignment and the first one found is optimal. Failed
+        states, (remaining courses, resources in use), are memoized.
+        
+        Args:
+            compat: Room compatibility of each course (see _room_compatibility)
+        
+        Returns:
+            A result in the same form as _solve_component, or None if the
+            search checks more than SMALL_SEARCH_CHECK_LIMIT options
+        """
+        order = sorted(self.courses, key=lambda code: -self.courses[code]['priority'])
+        
+        # Candidate assignments per course, each with the resources it occupies
+        room_ids = list(self.rooms)
+        teacher_index = self.teacher_index
+        candidates = []
+        for course_code in order:
+            course = self.courses[course_code]
+            teacher = teacher_index[course['teacher']]
+            dept = course['department']
+            rooms = [room_ids[r_idx] for r_idx in np.flatnonzero(compat[course_code]).tolist()]
+            options = []
+            for pattern, _, _ in self._course_blocks(course):
+                day_range, slot_range = self._block_indices[pattern]
+                for s_idx in slot_range:
+                    for d_idx in day_range:
+                        for room_id in rooms:
+                            resources = [('room', d_idx, s_idx, room_id),
+                                         ('teacher', d_idx, s_idx, teacher)]
+                            if dept:
+                                resources.append(('dept', d_idx, s_idx, dept))
+                            options.append(((d_idx, s_idx, room_id), resources))
+            candidates.append(options)
+        
+        used = set()
+        chosen = {}
+        failed = set()
+        counters = {'checks': 0, 'nodes': 0, 'backtracks': 0}
+        
+        def search(remaining):
+            """Return True if solved, False if infeasible, None if over budget."""
+            if not remaining:
+                return True
+            state = (remaining, frozenset(used))
+            if state in failed:
+                return False
             
-            # Handle TTh pattern (or ANY)
-            if pattern in ["TTh", "ANY"]:
-                for time_idx, time_slot in enumerate(self.tth_slots):
-                    for day in self.days["TTh"]:
-                        for room_id in self.rooms:
-                            # Only consider rooms with sufficient capacity
-                            if self.rooms[room_id]['capacity'] >= course['min_room_capacity']:
-                                var_name = f"{course_code}_{day}_{time_slot}_{room_id}"
-                                course_vars[course_code][(day, time_slot, room_id)] = model.NewBoolVar(var_name)
-        
-        # Each course must be scheduled exactly once
-        for course_code, vars_dict in course_vars.items():
-            model.Add(sum(vars_dict.values()) == 1)
-        
-        # A room cannot be double-booked
-        for time_slot in self.mwf_slots:
-            for day in self.days["MWF"]:
-                for room_id in self.rooms:
-                    room_booked_vars = []
-                    for course_code, vars_dict in course_vars.items():
-                        for (d, t, r), var in vars_dict.items():
-                            if d == day and t == time_slot and r == room_id:
-                                room_booked_vars.append(var)
-                    if room_booked_vars:
-                        model.Add(sum(room_booked_vars) <= 1)
-        
-        for time_slot in self.tth_slots:
-            for day in self.days["TTh"]:
-                for room_id in self.rooms:
-                    room_booked_vars = []
-                    for course_code, vars_dict in course_vars.items():
-                        for (d, t, r), var in vars_dict.items():
-                            if d == day and t == time_slot and r == room_id:
-                                room_booked_vars.append(var)
-                    if room_booked_vars:
-                        model.Add(sum(room_booked_vars) <= 1)
-        
-        # A teacher cannot teach two courses at the same time
-        for teacher in self.teachers:
-            # Get all courses taught by this teacher
-            teacher_courses = [c for c, details in self.courses.items() 
-                               if details['teacher'] == teacher]
+            # Pick the most constrained course, failing early if one is stuck
+            best, best_options = None, None
+            for c_idx in remaining:
+                options = [o for o in candidates[c_idx] if not any(r in used for r in o[1])]
+                counters['checks'] += len(candidates[c_idx])
+                if not options:
+                    failed.add(state)
+                    return False
+                if best is None or len(options) < len(best_options):
+                    best, best_options = c_idx, options
+            if counters['checks'] > SMALL_SEARCH_CHECK_LIMIT:
+                return None
             
-            # Check MWF time slots
-            for time_slot in self.mwf_slots:
-                for day in self.days["MWF"]:
-                    teacher_vars = []
-                    for course_code in teacher_courses:
-                        for (d, t, r), var in course_vars[course_code].items():
-                            if d == day and t == time_slot:
-                                teacher_vars.append(var)
-                    if teacher_vars:
-                        model.Add(sum(teacher_vars) <= 1)
+            rest = tuple(c_idx for c_idx in remaining if c_idx != best)
+            for option, resources in best_options:
+                counters['nodes'] += 1
+                used.update(resources)
+                chosen[best] = option
+                found = search(rest)
+                if found is not False:
+                    return found
+                used.difference_update(resources)
+                counters['backtracks'] += 1
+            failed.add(state)
+            return False
+        
+        found = search(tuple(range(len(order))))
+        if found is None:
+            return None
+        
+        result = {
+            'status': 'OPTIMAL' if found else 'INFEASIBLE',
+            'branches': counters['nodes'],
+            'conflicts': counters['backtracks'],
+            'objective_value': None,
+            'assignments': {}
+        }
+        if found:
+            result['objective_value'] = float(sum(c['priority'] for c in self.courses.values()))
+            for c_idx, course_code in enumerate(order):
+                d_idx, s_idx, room_id = chosen[c_idx]
+                result['assignments'][course_code] = [{
+                    'day': self._day_names[d_idx],
+                    'time': self._slot_names[s_idx],
+                    'room': room_id
+                }]
+        return result
+    
+    def solve(self, time_limit_seconds=60, num_workers=None, solver_params=None):
+        """
+        Solve the scheduling problem using CP-SAT solver.
+        
+        Tiny instances are searched directly (see _solve_small). Otherwise
+        the courses are split into independent components (see
+        _independent_components) that are solved one at a time within the
+        overall time limit. Solved components are cached, so a request that
+        only changes some courses re-solves just the components they touch.
+        
+        Args:
+            time_limit_seconds: Maximum time to spend solving
+            num_workers: Number of parallel CP-SAT search workers
+                         (defaults to the CPU count, capped at 8).
+                         Pass 1 for reproducible schedules; parallel
+                         search may return a different optimal schedule
+                         from run to run.
+            solver_params: Optional dict of CP-SAT parameters overriding
+                           DEFAULT_SOLVER_PARAMETERS
             
-            # Check TTh time slots
-            for time_slot in self.tth_slots:
-                for day in self.days["TTh"]:
-                    teacher_vars = []
-                    for course_code in teacher_courses:
-                        for (d, t, r), var in course_vars[course_code].items():
-                            if d == day and t == time_slot:
-                                teacher_vars.append(var)
-                    if teacher_vars:
-                        model.Add(sum(teacher_vars) <= 1)
-        
-        # Departments may have specific constraints (e.g., no department has all its courses at the same time)
-        for dept, course_codes in self.departments.items():
-            if len(course_codes) > 1:  # Only relevant if department has multiple courses
-                # Ensure department courses are spread throughout the day
-                for time_slot in self.mwf_slots:
-                    for day in self.days["MWF"]:
-                        dept_vars = []
-                        for course_code in course_codes:
-                            for (d, t, r), var in course_vars[course_code].items():
-                                if d == day and t == time_slot:
-                                    dept_vars.append(var)
-                        if dept_vars:
-                            model.Add(sum(dept_vars) <= 1)  # At most one course per department per time slot
-                
-                for time_slot in self.tth_slots:
-                    for day in self.days["TTh"]:
-                        dept_vars = []
-                        for course_code in course_codes:
-                            for (d, t, r), var in course_vars[course_code].items():
-                                if d == day and t == time_slot:
-                                    dept_vars.append(var)
-                        if dept_vars:
-                            model.Add(sum(dept_vars) <= 1)  # At most one course per department per time slot
-        
-        # Objective: maximize priority-weighted assignments
-        objective_terms = []
-        for course_code, vars_dict in course_vars.items():
-            priority = self.courses[course_code]['priority']
-            for var in vars_dict.values():
-                objective_terms.append(priority * var)
-        
-        model.Maximize(sum(objective_terms))
-        
-        # Create solver and solve
-        solver = cp_model.CpSolver()
-        solver.parameters.max_time_in_seconds = time_limit_seconds
-        
-        # Add solution callback to store all solutions found
-        status = solver.Solve(model)
+        Returns:
+            Dictionary with schedule and statistics
+        """
+        start_time = time.time()
+        
+        # If no courses or rooms, return empty schedule
+        if not self.courses or not self.rooms:
+            logger.warning("No courses or rooms defined")
+            return {'schedule': {}, 'stats': {'status': 'No courses or rooms defined'}}
+        
+        # Which rooms each course fits in, shared by every stage below
+        compat = self._room_compatibility()
+        
+        # Tiny instances are cheaper to search directly than to hand to CP-SAT
+        small = None
+        if len(self.courses) * len(self.rooms) * 50 < SMALL_INSTANCE_LIMIT:
+            small = self._solve_small(compat)
+        
+        results = []
+        if small is not None:
+            results.append(small)
+        else:
+            # Solve each component, reusing cached results where possible
+            for course_codes in self._independent_components(compat):
+                key = self._component_key(course_codes)
+                result = _get_cached_component(key)
+                if result is None:
+                    remaining = max(time_limit_seconds - (time.time() - start_time), 0)
+                    result = self._solve_component(course_codes, compat, remaining,
+                                                   num_workers, solver_params)
+                    # Only definite answers are reusable; a timed-out component
+                    # may still be solved given more time
+                    if result['status'] in ('OPTIMAL', 'INFEASIBLE'):
+                        _cache_component(key, result)
+                results.append(result)
+                if result['status'] == 'INFEASIBLE':
+                    break
+        
+        # The schedule is only as good as its worst component
+        statuses = [r['status'] for r in results]
+        if 'INFEASIBLE' in statuses:
+            status = 'INFEASIBLE'
+        elif any(s not in ('OPTIMAL', 'FEASIBLE') for s in statuses):
+            status = next(s for s in statuses if s not in ('OPTIMAL', 'FEASIBLE'))
+        elif 'FEASIBLE' in statuses:
+            status = 'FEASIBLE'
+        else:
+            status = 'OPTIMAL'
         
         # Process results
         schedule = {}
         stats = {
-            'status': solver.StatusName(status),
+            'status': status,
             'solve_time': time.time() - start_time,
-            'branches': solver.NumBranches(),
-            'conflicts': solver.NumConflicts(),
-            'objective_value': solver.ObjectiveValue() if status == cp_model.OPTIMAL or status == cp_model.FEASIBLE else None
+            'branches': sum(r['branches'] for r in results),
+            'conflicts': sum(r['conflicts'] for r in results),
+            'objective_value': (sum(r['objective_value'] for r in results)
+                                if status in ('OPTIMAL', 'FEASIBLE') else None),
+            'components': len(results)
         }
         
-        if status == cp_model.OPTIMAL or status == cp_model.FEASIBLE:
-            for course_code, vars_dict in course_vars.items():
-                schedule[course_code] = []
-                for (day, time_slot, room_id), var in vars_dict.items():
-                    if solver.Value(var) == 1:
-                        schedule[course_code].append({
-                            'day': day,
-                            'time': time_slot,
-                            'room': room_id
-                        })
-                        logger.info(f"Scheduled {course_code} on {day} at {time_slot} in room {room_id}")
+        if status in ('OPTIMAL', 'FEASIBLE'):
+            assignments_by_course = {}
+            for result in results:
+                assignments_by_course.update(result['assignments'])
+            
+            # Copy the assignments so callers can't modify cached results
+            for course_code in self.courses:
+                schedule[course_code] = [dict(a) for a in assignments_by_course[course_code]]
+            
+            if logger.isEnabledFor(logging.DEBUG):
+                for course_code, course_assignments in schedule.items():
+                    for a in course_assignments:
+                        logger.debug("Scheduled %s on %s at %s in room %s",
+                                     course_code, a['day'], a['time'], a['room'])
             
-            logger.info(f"Schedule successfully generated. "
-                       f"Status: {stats['status']}, "
-                       f"Time: {stats['solve_time']:.2f}s, "
-                       f"Objective: {stats['objective_value']}")
+            logger.info("Schedule successfully generated. "
+                        "Courses: %d, Status: %s, Time: %.2fs, Objective: %s",
+                        len(schedule), stats['status'], stats['solve_time'],
+                        stats['objective_value'])
         else:
-            logger.warning(f"Could not find a valid schedule. Status: {stats['status']}")
+            logger.warning("Could not find a valid schedule. Status: %s", stats['status'])
         
         return {
             'schedule': schedule,
@@ -0,0 +1,53 @@
+"""
+Tests for the scheduling API
+
+Large schedules are streamed; the streamed body must decode to the same payload
+that ojsonify would have sent in one buffer.
+"""
+
+import json
+
+import pytest
+
+import schedule_api
+
+def solver_result(n_courses, **extra):
+    """Return a solver-shaped result with n_courses scheduled courses"""
+    schedule = {
+        f"C{i}": [{'day': day, 'time': '08:00-09:00', 'room': f"R{i % 7}"}
+                  for day in ('Monday', 'Wednesday', 'Friday')]
+        for i in range(n_courses)
+    }
+    result = {'schedule': schedule}
+    result.update(extra)
+    return result
+
+def payload(response):
+    return json.loads(b''.join(response.response))
+
+@pytest.mark.parametrize('n_courses', [
+    schedule_api.STREAM_MIN_COURSES,
+    2 * schedule_api.STREAM_CHUNK_COURSES,
+    2 * schedule_api.STREAM_CHUNK_COURSES + 1,
+])
+def test_streamed_body_matches_ojsonify(n_courses):
+    result = solver_result(n_courses, status='OPTIMAL',
+                           stats={'objective_value': 1.5, 'wall_time': 0.25, 'components': 3})
+    streamed = b''.join(schedule_api._stream_schedule(result))
+    assert json.loads(streamed) == json.loads(schedule_api.ojsonify(result).get_data())
+
+def test_streamed_body_without_other_keys():
+    result = solver_result(schedule_api.STREAM_MIN_COURSES)
+    streamed = b''.join(schedule_api._stream_schedule(result))
+    assert json.loads(streamed) == result
+
+def test_only_large_schedules_are_streamed():
+    small = solver_result(schedule_api.STREAM_MIN_COURSES - 1, status='OPTIMAL')
+    large = solver_result(schedule_api.STREAM_MIN_COURSES, status='OPTIMAL')
+    
+    small_response = schedule_api._schedule_response(small)
+    large_response = schedule_api._schedule_response(large)
+    assert not small_response.is_streamed
+    assert large_response.is_streamed
+    assert large_response.mimetype == 'application/json'
+    assert payload(large_response) == json.loads(schedule_api.ojsonify(large).get_data())
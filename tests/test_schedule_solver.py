@@ -0,0 +1,145 @@
+"""
+Tests for the scheduling engine
+
+Each schedule is checked for clashes, room capacity and day pattern, and its
+status and objective are compared against a reference: every course x day x
+slot x room combination as a CP-SAT variable in one plain model.
+"""
+
+import random
+
+import pytest
+from ortools.sat.python import cp_model
+
+from schedule_solver_backend import ScheduleSolver
+
+DEPARTMENTS = (None, 'CS', 'MATH', 'ENG')
+
+def random_solver(seed, n_courses, n_rooms, n_teachers, capacities=(25, 30, 50, 100),
+                  patterns=('MWF', 'TTh', None)):
+    """Return a ScheduleSolver filled with a reproducible random instance"""
+    rng = random.Random(seed)
+    solver = ScheduleSolver()
+    for i in range(n_rooms):
+        solver.add_room(f"R{i}", rng.choice(capacities))
+    for i in range(n_courses):
+        solver.add_course(
+            code=f"C{i}",
+            name=f"Course {i}",
+            teacher=f"T{rng.randrange(n_teachers)}",
+            hours=3,
+            preferred_days=rng.choice(patterns),
+            min_room_capacity=rng.choice([0, 25, 30, 50, 100]),
+            department=rng.choice(DEPARTMENTS),
+            priority=rng.randint(1, 5)
+        )
+    return solver
+
+def course_cells(solver, course):
+    """Return the (day, time) pairs a course may be scheduled in"""
+    cells = []
+    if course['preferred_days'] in ('MWF', None):
+        cells += [(d, t) for d in solver.days['MWF'] for t in solver.mwf_slots]
+    if course['preferred_days'] in ('TTh', None):
+        cells += [(d, t) for d in solver.days['TTh'] for t in solver.tth_slots]
+    return cells
+
+def reference_solve(solver):
+    """Solve the instance as a single plain CP-SAT model; return (status, objective)"""
+    model = cp_model.CpModel()
+    by_room, by_teacher, by_dept = {}, {}, {}
+    objective = []
+    for code, course in solver.courses.items():
+        literals = []
+        for day, time in course_cells(solver, course):
+            for room_id, room in solver.rooms.items():
+                if room['capacity'] < course['min_room_capacity']:
+                    continue
+                var = model.NewBoolVar(f"{code}_{day}_{time}_{room_id}")
+                literals.append(var)
+                by_room.setdefault((day, time, room_id), []).append(var)
+                by_teacher.setdefault((day, time, course['teacher']), []).append(var)
+                if course['department']:
+                    by_dept.setdefault((day, time, course['department']), []).append(var)
+                objective.append(course['priority'] * var)
+        model.AddExactlyOne(literals)
+    for buckets in (by_room, by_teacher, by_dept):
+        for bucket in buckets.values():
+            model.AddAtMostOne(bucket)
+    model.Maximize(sum(objective))
+    
+    cp_solver = cp_model.CpSolver()
+    cp_solver.parameters.max_time_in_seconds = 30
+    status = cp_solver.Solve(model)
+    objective_value = cp_solver.ObjectiveValue() if status == cp_model.OPTIMAL else None
+    return cp_solver.StatusName(status), objective_value
+
+def assert_valid_schedule(solver, result):
+    """Check a solved schedule for clashes, room capacity and day pattern"""
+    schedule = result['schedule']
+    assert list(schedule) == list(solver.courses)
+    in_use = set()
+    for code, assignments in schedule.items():
+        course = solver.courses[code]
+        assert len(assignments) == 1
+        a = assignments[0]
+        assert (a['day'], a['time']) in course_cells(solver, course)
+        assert solver.rooms[a['room']]['capacity'] >= course['min_room_capacity']
+        resources = [('room', a['room']), ('teacher', course['teacher'])]
+        if course['department']:
+            resources.append(('dept', course['department']))
+        for resource in resources:
+            key = (a['day'], a['time']) + resource
+            assert key not in in_use, f"{code} clashes on {key}"
+            in_use.add(key)
+
+def assert_matches_reference(solver, result):
+    """Check a result against the single-model reference solve"""
+    status, objective_value = reference_solve(solver)
+    assert result['stats']['status'] == status
+    if status == 'OPTIMAL':
+        assert_valid_schedule(solver, result)
+        assert result['stats']['objective_value'] == objective_value
+    else:
+        assert result['schedule'] == {}
+
+@pytest.mark.parametrize('seed', range(40))
+def test_small_instances_match_reference(seed):
+    """Tiny instances go through the depth-first search (_solve_small)"""
+    rng = random.Random(seed)
+    n_rooms = rng.randint(1, 3)
+    solver = random_solver(seed, rng.randint(1, 39 // n_rooms), n_rooms, n_teachers=3)
+    result = solver.solve(time_limit_seconds=10)
+    assert_matches_reference(solver, result)
+
+@pytest.mark.parametrize('seed', range(6))
+def test_independent_components_match_reference(seed):
+    """Courses fixed to MWF or TTh never interact, so they are solved apart"""
+    solver = random_solver(seed, 50, 6, n_teachers=20, patterns=('MWF', 'TTh'))
+    assert len(solver._independent_components(solver._room_compatibility())) >= 2
+    result = solver.solve(time_limit_seconds=20, num_workers=1)
+    assert_matches_reference(solver, result)
+
+def test_cached_components_are_reused_safely():
+    """A repeated instance is answered from the component cache, unchanged"""
+    first = random_solver(100, 50, 6, n_teachers=20).solve(time_limit_seconds=20)
+    assert first['stats']['status'] == 'OPTIMAL'
+    expected = {code: [dict(a) for a in assignments]
+                for code, assignments in first['schedule'].items()}
+    # Changing a returned schedule must not leak into the cache
+    for assignments in first['schedule'].values():
+        assignments[0]['room'] = 'changed'
+    
+    second = random_solver(100, 50, 6, n_teachers=20).solve(time_limit_seconds=20)
+    assert second['schedule'] == expected
+    assert second['stats']['objective_value'] == first['stats']['objective_value']
+
+@pytest.mark.parametrize('seed', range(6))
+def test_room_pools_match_reference(seed, monkeypatch):
+    """Rooms of equal capacity are pooled in the model, then handed out"""
+    # Skip the greedy first-fit so that the pooled CP-SAT model is solved
+    monkeypatch.setattr(ScheduleSolver, '_greedy_seed',
+                        lambda self, course_vars, pool_rooms: [])
+    solver = random_solver(300 + seed, 60, 6, n_teachers=20, capacities=(50, 100))
+    result = solver.solve(time_limit_seconds=20, num_workers=1)
+    assert_matches_reference(solver, result)